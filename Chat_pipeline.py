@@ -1,9 +1,21 @@
 import os
+import re
 import sys
 import json
-import requests
+import time
+import random
+import asyncio
+import threading
+import weakref
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import httpx
+import numpy as np
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+import metrics
 
 load_dotenv()
 
@@ -13,7 +25,38 @@ CONFIG = {
     "chat_url": "http://localhost:8080/v1/chat/completions",
     "emb_url": "https://api.voyageai.com/v1/embeddings",
     "db_url": os.getenv("DATABASE_URL") if os.getenv("DATABASE_URL") else None,
-    "model": "llama-3.3-70b"
+    "model": "llama-3.3-70b",
+    # Default knowledge_chunks tenant for retrieval; None searches every tenant.
+    "kb_tenant": os.getenv("KB_TENANT") or None,
+    "http_max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", "200")),
+    "db_pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    # TTL cache for deterministic (temperature 0) chat calls and embeddings; 0 disables it.
+    "response_cache_ttl": float(os.getenv("RESPONSE_CACHE_TTL", "0")),
+    "response_cache_size": int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    # Semantic cache for near-duplicate chat prompts. Call types opt in through
+    # SEMANTIC_CACHE_TYPES, e.g. "questions:0.97,classify_name" (type[:threshold]).
+    "semantic_cache": {
+        "types": os.getenv("SEMANTIC_CACHE_TYPES", ""),
+        "threshold": float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97")),
+        "max_entries": int(os.getenv("SEMANTIC_CACHE_SIZE", "2048")),
+        # Cap per call type and template, which bounds the work of a single lookup.
+        "bucket_size": int(os.getenv("SEMANTIC_CACHE_BUCKET_SIZE", "512")),
+        "ttl": float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+        # Fraction of hits re-checked against the model in the background to measure false hits.
+        "verify_rate": float(os.getenv("SEMANTIC_CACHE_VERIFY_RATE", "0.02")),
+    },
+    # Per-upstream limits shared by every caller on the pipeline loop.
+    # "rate" is requests per second (token bucket); None disables it.
+    "limits": {
+        "chat": {
+            "concurrency": int(os.getenv("CHAT_MAX_CONCURRENCY", "32")),
+            "rate": float(os.getenv("CHAT_MAX_RPS")) if os.getenv("CHAT_MAX_RPS") else None,
+        },
+        "voyage": {
+            "concurrency": int(os.getenv("VOYAGE_MAX_CONCURRENCY", "16")),
+            "rate": float(os.getenv("VOYAGE_MAX_RPS")) if os.getenv("VOYAGE_MAX_RPS") else None,
+        },
+    },
 }
 
 def get_db_engine():
@@ -21,42 +64,509 @@ def get_db_engine():
         return None
     return create_engine(CONFIG["db_url"])
 
-def get_embedding(text_input):
-    try:
-        if not CONFIG["voyage_key"]:
-            return []
-            
-        resp = requests.post(
-            CONFIG["emb_url"],
-            headers={"Authorization": f"Bearer {CONFIG['voyage_key']}"},
-            json={"model": "voyage-3", "input": text_input, "input_type": "query"},
-            timeout=10
+class UpstreamLimiter:
+    """Concurrency cap plus optional token-bucket rate limit for one upstream."""
+
+    def __init__(self, concurrency, rate=None):
+        self._sem = asyncio.Semaphore(concurrency)
+        self._rate = rate
+        self._tokens = max(rate, 1.0) if rate else 0.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def _take_token(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(max(self._rate, 1.0), self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+    async def __aenter__(self):
+        await self._sem.acquire()
+        if self._rate:
+            try:
+                await self._take_token()
+            except BaseException:
+                self._sem.release()
+                raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._sem.release()
+
+class ResponseCache:
+    """Bounded LRU of upstream responses that expire after `ttl` seconds."""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0 or value is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key onto one upstream request."""
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key, fn, call="upstream"):
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.inc("coalesced_calls", call=call, stage=metrics.current_stage())
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller being cancelled does not cancel the shared call.
+        return await asyncio.shield(task)
+
+class SemanticCache:
+    """LRU + TTL store of chat responses looked up by prompt-embedding similarity.
+
+    Entries are bucketed by call type and template, so only prompts built from the
+    same template are ever compared. Each bucket keeps a stacked matrix of its
+    vectors so a lookup is one matrix-vector product.
+    """
+
+    def __init__(self, types="", threshold=0.97, max_entries=2048, bucket_size=512, ttl=3600, verify_rate=0.0):
+        self.thresholds = {}
+        for spec in filter(None, (t.strip() for t in types.split(","))):
+            name, _, value = spec.partition(":")
+            self.thresholds[name] = float(value) if value else threshold
+        self.max_entries = max_entries
+        self.bucket_size = bucket_size
+        self.ttl = ttl
+        self.verify_rate = verify_rate
+        # bucket -> OrderedDict(entry_id -> (vector, value, expires)), least recently used first
+        self._buckets = {}
+        # bucket -> (entry ids, matrix, expiry array), rebuilt after the bucket changes
+        self._matrices = {}
+        self._lru = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def enabled(self, call_type):
+        return call_type in self.thresholds
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector)) or 1.0
+        return vector / norm
+
+    def _matrix(self, bucket):
+        cached = self._matrices.get(bucket)
+        if cached is None:
+            entries = self._buckets[bucket]
+            cached = self._matrices[bucket] = (
+                list(entries),
+                np.stack([vec for vec, _, _ in entries.values()]),
+                np.array([expires for _, _, expires in entries.values()]),
+            )
+        return cached
+
+    def lookup(self, call_type, bucket, vector):
+        """Return (entry_id, response, similarity) of the best match above the threshold, or None."""
+        vector = self._unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            if bucket not in self._buckets:
+                return None
+            ids, matrix, expires = self._matrix(bucket)
+            for i in np.flatnonzero(expires < now):
+                self._remove(ids[i])
+            sims = np.where(expires < now, -1.0, matrix @ vector)
+            best = int(np.argmax(sims))
+            if sims[best] < self.thresholds[call_type]:
+                return None
+            entry_id = ids[best]
+            self._lru.move_to_end(entry_id)
+            self._buckets[bucket].move_to_end(entry_id)
+            return entry_id, self._buckets[bucket][entry_id][1], float(sims[best])
+
+    def store(self, bucket, vector, value):
+        if value is None:
+            return None
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            entries = self._buckets.setdefault(bucket, OrderedDict())
+            entries[entry_id] = (self._unit(vector), value, time.monotonic() + self.ttl)
+            self._matrices.pop(bucket, None)
+            self._lru[entry_id] = bucket
+            while len(entries) > self.bucket_size:
+                self._remove(next(iter(entries)))
+            while len(self._lru) > self.max_entries:
+                self._remove(next(iter(self._lru)))
+            return entry_id
+
+    def replace(self, entry_id, value):
+        with self._lock:
+            bucket = self._lru.get(entry_id)
+            if bucket is not None:
+                vec, _, expires = self._buckets[bucket][entry_id]
+                self._buckets[bucket][entry_id] = (vec, value, expires)
+
+    def _remove(self, entry_id):
+        bucket = self._lru.pop(entry_id, None)
+        if bucket is not None:
+            entries = self._buckets.get(bucket, {})
+            entries.pop(entry_id, None)
+            self._matrices.pop(bucket, None)
+            if not entries:
+                self._buckets.pop(bucket, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._matrices.clear()
+            self._lru.clear()
+
+response_cache = ResponseCache(CONFIG["response_cache_ttl"], CONFIG["response_cache_size"])
+semantic_cache = SemanticCache(**CONFIG["semantic_cache"])
+
+def _request_key(kind, *parts):
+    raw = json.dumps([kind, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class _LoopResources:
+    """HTTP client, DB pool and limiters bound to a single event loop."""
+
+    def __init__(self):
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=CONFIG["http_max_connections"],
+                max_keepalive_connections=CONFIG["http_max_connections"],
+            )
         )
+        self.limiters = {name: UpstreamLimiter(**cfg) for name, cfg in CONFIG["limits"].items()}
+        self.single_flight = SingleFlight()
+        # Strong references to fire-and-forget tasks, so they are not collected mid-run.
+        self.background = set()
+        self._db = None
+
+    def spawn(self, coro, name):
+        task = asyncio.ensure_future(coro)
+        self.background.add(task)
+        task.add_done_callback(lambda t: self._finished(t, name))
+        return task
+
+    def _finished(self, task, name):
+        self.background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            metrics.inc("background_task_errors", task=name, error=_error_class(task.exception()))
+
+    @property
+    def db(self):
+        if self._db is None and CONFIG["db_url"]:
+            # Imported here so greenlet/asyncpg are only needed when a database is configured.
+            from sqlalchemy.ext.asyncio import create_async_engine
+            self._db = create_async_engine(
+                _async_db_url(CONFIG["db_url"]),
+                pool_size=CONFIG["db_pool_size"],
+                pool_pre_ping=True,
+                # Plan each filtered search with its actual tenant/section so the
+                # matching partial ANN index can be chosen.
+                connect_args={"server_settings": {"plan_cache_mode": "force_custom_plan"}},
+            )
+        return self._db
+
+    async def aclose(self):
+        await self.http.aclose()
+        if self._db is not None:
+            await self._db.dispose()
+
+_resources = weakref.WeakKeyDictionary()
+_loop = None
+_loop_lock = threading.Lock()
+
+def _async_db_url(url):
+    return re.sub(r"^postgres(ql)?(\+\w+)?://", "postgresql+asyncpg://", url)
+
+def _get_resources():
+    loop = asyncio.get_running_loop()
+    res = _resources.get(loop)
+    if res is None:
+        res = _resources[loop] = _LoopResources()
+    return res
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="chat-pipeline-loop", daemon=True).start()
+    return _loop
+
+def _error_class(e):
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"HTTP{e.response.status_code}"
+    return type(e).__name__
+
+def _record_cache(call, hit):
+    metrics.inc("cache_hits" if hit else "cache_misses", call=call, stage=metrics.current_stage())
+
+async def _in_stage(stage, coro):
+    with metrics.tagged(stage):
+        return await coro
+
+def submit(coro):
+    """Schedule a pipeline coroutine on the shared background loop; returns a concurrent Future."""
+    # The loop thread does not see the caller's context, so carry the metrics stage over.
+    return asyncio.run_coroutine_threadsafe(_in_stage(metrics.current_stage(), coro), _get_loop())
+
+def run_sync(coro):
+    """Run a pipeline coroutine on the shared background loop and wait for it."""
+    return submit(coro).result()
+
+async def close_async_resources():
+    res = _resources.pop(asyncio.get_running_loop(), None)
+    if res is not None:
+        await res.aclose()
+
+async def warm_up_async():
+    """Open a pooled DB connection and keep-alive connections to each upstream; returns per-phase seconds."""
+    res = _get_resources()
+    timings = {}
+
+    async def timed(phase, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            metrics.inc("warmup_errors", phase=phase, error=_error_class(e))
+        timings[phase] = time.perf_counter() - start
+        metrics.observe("startup_seconds", timings[phase], phase=phase)
+
+    async def open_db():
+        if res.db is None: return
+        async with res.db.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    async def prime(url):
+        # Any response will do: the point is the TCP/TLS handshake on a pooled connection.
+        await res.http.head(url, timeout=10)
+
+    await asyncio.gather(
+        timed("db", open_db()),
+        timed("chat_http", prime(CONFIG["chat_url"])),
+        timed("voyage_http", prime(CONFIG["emb_url"])),
+    )
+    return timings
+
+async def get_embedding_async(text_input):
+    if not CONFIG["voyage_key"]:
+        return []
+
+    key = _request_key("embedding", "voyage-3", text_input)
+    cached = response_cache.get(key)
+    if response_cache.ttl > 0:
+        _record_cache("embedding", cached is not None)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        vector = await _fetch_embedding(text_input)
+        if vector:
+            response_cache.set(key, vector)
+        return vector
+
+    return await _get_resources().single_flight.do(key, fetch, call="embedding")
+
+@asynccontextmanager
+async def _limited(res, upstream):
+    start = time.perf_counter()
+    async with res.limiters[upstream]:
+        metrics.observe("limiter_wait_seconds", time.perf_counter() - start, upstream=upstream)
+        yield
+
+async def _fetch_embedding(text_input):
+    start = time.perf_counter()
+    try:
+        res = _get_resources()
+        async with _limited(res, "voyage"):
+            resp = await res.http.post(
+                CONFIG["emb_url"],
+                headers={"Authorization": f"Bearer {CONFIG['voyage_key']}"},
+                json={"model": "voyage-3", "input": text_input, "input_type": "query"},
+                timeout=10
+            )
         resp.raise_for_status()
-        return resp.json()["data"][0]["embedding"]
-    except Exception:
+        vector = resp.json()["data"][0]["embedding"]
+        metrics.record_call("embedding", time.perf_counter() - start)
+        return vector
+    except Exception as e:
+        metrics.record_call("embedding", time.perf_counter() - start, error=_error_class(e))
         return []
 
-def retrieve_context(query_text):
-    vector = get_embedding(query_text)
+def _undefined_column(e):
+    # SQLSTATE 42703: knowledge_chunks has not been migrated (see KB_migrate.py).
+    return isinstance(e, DBAPIError) and getattr(e.orig, "sqlstate", None) == "42703"
+
+def _retrieval_query(tenant=None, source_doc=None, section=None, help_level=None):
+    clauses, params = [], {}
+    for column, value in (("tenant", tenant), ("source_doc", source_doc), ("section", section)):
+        if value is not None:
+            clauses.append(f"{column} = :{column}")
+            params[column] = value
+    if help_level is not None:
+        # Chunks that cover every level carry no help_level.
+        clauses.append("(help_level = :help_level OR help_level IS NULL)")
+        params["help_level"] = help_level
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    sql = text(f"SELECT content FROM knowledge_chunks {where}ORDER BY embedding <=> CAST(:vec AS vector) LIMIT :limit")
+    return sql, params
+
+async def retrieve_context_async(query_text, tenant=None, section=None, help_level=None, source_doc=None, limit=8):
+    """Nearest chunks to `query_text`, filtered on knowledge_chunks metadata before ranking.
+
+    If the section/help_level filters match nothing (e.g. chunks loaded before they
+    were tagged), the search is retried within the tenant only. On a table without
+    the metadata columns it falls back to an unfiltered search.
+    """
+    vector = await get_embedding_async(query_text)
     if not vector: return ""
-    
+
+    tenant = tenant or CONFIG["kb_tenant"]
+    start = time.perf_counter()
     try:
-        db = get_db_engine()
+        db = _get_resources().db
         if not db: return ""
-        
-        with db.connect() as conn:
-            sql = text("SELECT content FROM knowledge_chunks ORDER BY embedding <=> CAST(:vec AS vector) LIMIT 8")
-            rows = conn.execute(sql, {"vec": str(vector)}).fetchall()
+
+        async with db.connect() as conn:
+            async def search(**filters):
+                sql, params = _retrieval_query(**filters)
+                return (await conn.execute(sql, {**params, "vec": str(vector), "limit": limit})).fetchall()
+
+            try:
+                rows = await search(tenant=tenant, source_doc=source_doc, section=section, help_level=help_level)
+            except DBAPIError as e:
+                if not _undefined_column(e): raise
+                await conn.rollback()
+                metrics.inc("retrieve_schema_fallbacks", stage=metrics.current_stage())
+                rows = await search()
+            else:
+                if not rows and (section or help_level):
+                    metrics.inc("retrieve_filter_fallbacks", stage=metrics.current_stage())
+                    rows = await search(tenant=tenant, source_doc=source_doc)
+        metrics.record_call("retrieve", time.perf_counter() - start)
         return "\n---\n".join(r[0] for r in rows)
-    except Exception:
+    except Exception as e:
+        metrics.record_call("retrieve", time.perf_counter() - start, error=_error_class(e))
         return ""
 
-def llm_chat(messages, temperature=0.1, json_mode=False):
-    try:
-        if not CONFIG["maple_key"]:
-            return None
+def _normalize_prompt(text_input):
+    return " ".join(text_input.lower().split())
+
+def _same_response(a, b, json_mode):
+    if json_mode:
+        try:
+            return json.loads(a) == json.loads(b)
+        except Exception:
+            pass
+    return _normalize_prompt(a or "") == _normalize_prompt(b or "")
+
+async def _semantic_lookup(messages, temperature, json_mode, cache_type, cache_template, cache_text, fetch):
+    """Serve from the semantic cache or fetch and remember; returns (used_cache, content)."""
+    stage = metrics.current_stage()
+    prompt = cache_text if cache_text is not None else "\n".join(m["content"] for m in messages)
+    vector = await get_embedding_async(_normalize_prompt(prompt))
+    if not vector:
+        return False, None
+    bucket = _request_key("semantic", cache_type, cache_template, CONFIG["model"], temperature, json_mode)
+    hit = semantic_cache.lookup(cache_type, bucket, vector)
+    if hit is None:
+        metrics.inc("semantic_cache_misses", call_type=cache_type, stage=stage)
+        content = await fetch()
+        semantic_cache.store(bucket, vector, content)
+        return True, content
 
+    entry_id, content, similarity = hit
+    metrics.inc("semantic_cache_hits", call_type=cache_type, stage=stage)
+    metrics.observe("semantic_cache_similarity", similarity, call_type=cache_type)
+    if random.random() < semantic_cache.verify_rate:
+        async def verify():
+            fresh = await fetch()
+            if fresh is None:
+                return
+            metrics.inc("semantic_cache_verified", call_type=cache_type)
+            if not _same_response(fresh, content, json_mode):
+                metrics.inc("semantic_cache_false_hits", call_type=cache_type)
+                semantic_cache.replace(entry_id, fresh)
+        _get_resources().spawn(verify(), "semantic_cache_verify")
+    return True, content
+
+async def llm_chat_async(messages, temperature=0.1, json_mode=False, cache_type=None, cache_template="", cache_text=None):
+    """Chat completion content, or None on failure.
+
+    `cache_type` opts the call into the semantic cache when that type is enabled in
+    CONFIG; `cache_template` scopes matches (e.g. section and level) and `cache_text`
+    is the part of the prompt to compare, defaulting to the whole prompt.
+    """
+    if not CONFIG["maple_key"]:
+        return None
+
+    key = _request_key("chat", CONFIG["model"], messages, temperature, json_mode)
+    cacheable = temperature == 0
+    if cacheable:
+        cached = response_cache.get(key)
+        if response_cache.ttl > 0:
+            _record_cache("chat", cached is not None)
+        if cached is not None:
+            return cached
+
+    async def fetch():
+        content = await _fetch_chat(messages, temperature, json_mode)
+        if cacheable:
+            response_cache.set(key, content)
+        return content
+
+    async def coalesced():
+        return await _get_resources().single_flight.do(key, fetch, call="chat")
+
+    if cache_type and semantic_cache.enabled(cache_type):
+        used, content = await _semantic_lookup(
+            messages, temperature, json_mode, cache_type, cache_template, cache_text, coalesced
+        )
+        if used:
+            return content
+
+    return await coalesced()
+
+async def _fetch_chat(messages, temperature, json_mode):
+    start = time.perf_counter()
+    try:
         payload = {
             "model": CONFIG["model"],
             "messages": messages,
@@ -68,13 +578,31 @@ def llm_chat(messages, temperature=0.1, json_mode=False):
         if json_mode:
             payload["response_format"] = {"type": "json_object"}
 
-        resp = requests.post(
-            CONFIG["chat_url"],
-            headers={"Authorization": f"Bearer {CONFIG['maple_key']}"},
-            json=payload,
-            timeout=120
-        )
-        resp.raise_for_status() 
-        return resp.json()["choices"][0]["message"]["content"]
-    except Exception:
-        return None
\ No newline at end of file
+        res = _get_resources()
+        async with _limited(res, "chat"):
+            resp = await res.http.post(
+                CONFIG["chat_url"],
+                headers={"Authorization": f"Bearer {CONFIG['maple_key']}"},
+                json=payload,
+                timeout=120
+            )
+        resp.raise_for_status()
+        body = resp.json()
+        usage = body.get("usage") or {}
+        stage = metrics.current_stage()
+        metrics.inc("prompt_tokens", usage.get("prompt_tokens", 0), stage=stage)
+        metrics.inc("completion_tokens", usage.get("completion_tokens", 0), stage=stage)
+        metrics.record_call("chat", time.perf_counter() - start)
+        return body["choices"][0]["message"]["content"]
+    except Exception as e:
+        metrics.record_call("chat", time.perf_counter() - start, error=_error_class(e))
+        return None
+
+def get_embedding(text_input):
+    return run_sync(get_embedding_async(text_input))
+
+def retrieve_context(query_text, **filters):
+    return run_sync(retrieve_context_async(query_text, **filters))
+
+def llm_chat(messages, temperature=0.1, json_mode=False, **cache_options):
+    return run_sync(llm_chat_async(messages, temperature=temperature, json_mode=json_mode, **cache_options))
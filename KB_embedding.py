@@ -4,6 +4,7 @@ import psycopg2
 from psycopg2.extras import execute_values
 import voyageai
 from dotenv import load_dotenv
+from KB_migrate import DB_PARAMS, create_ann_indexes, infer_metadata, migrate
 
 load_dotenv()
 api_key = os.getenv("VOYAGE_API_KEY")
@@ -11,57 +12,55 @@ api_key = os.getenv("VOYAGE_API_KEY")
 if not api_key:
     raise ValueError("VOYAGE_API_KEY not found in .env file")
 
-DB_PARAMS = {
-    "dbname": "postgres",
-    "user": "postgres",
-    "password": "mysecretpassword",
-    "host": "localhost",
-    "port": "5432"
-}
+TENANT = os.getenv("KB_TENANT", "default")
+SOURCE_DOC = os.getenv("KB_SOURCE_DOC", "Knowledge Base.docx")
 
 try:
     csv_path = os.path.join('data', 'output', 'Semantic_chunk.csv')
     df = pd.read_csv(csv_path)
     print(f"Loaded {len(df)} rows from {csv_path}")
 
+    # Metadata columns in the CSV win; otherwise fall back to the env defaults and inference.
+    inferred = df['chunk_text'].map(infer_metadata)
+    if 'tenant' not in df: df['tenant'] = TENANT
+    if 'source_doc' not in df: df['source_doc'] = SOURCE_DOC
+    if 'section' not in df: df['section'] = [sec for sec, _ in inferred]
+    if 'help_level' not in df: df['help_level'] = [lvl for _, lvl in inferred]
+    df = df.astype(object).where(df.notna(), None)
+
     vo = voyageai.Client(api_key=api_key)
-    
+
     print("Generating Embeddings...")
     embeddings = vo.embed(
-        df['chunk_text'].tolist(), 
-        model="voyage-3", 
+        df['chunk_text'].tolist(),
+        model="voyage-3",
         input_type="document"
     ).embeddings
-    
+
     df['embedding'] = embeddings
 
     print("Connecting to Database...")
     conn = psycopg2.connect(**DB_PARAMS)
     cur = conn.cursor()
 
-    cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS knowledge_chunks (
-            id bigserial PRIMARY KEY,
-            content text,
-            embedding vector(1024)
-        );
-    """)
+    migrate(cur)
 
     print("Inserting data...")
     data_to_insert = [
-        (row['chunk_text'], row['embedding']) 
+        (row['chunk_text'], row['embedding'], row['tenant'], row['source_doc'], row['section'], row['help_level'])
         for _, row in df.iterrows()
     ]
 
-    insert_query = "INSERT INTO knowledge_chunks (content, embedding) VALUES %s"
+    insert_query = "INSERT INTO knowledge_chunks (content, embedding, tenant, source_doc, section, help_level) VALUES %s"
     execute_values(cur, insert_query, data_to_insert)
 
+    print("Building ANN indexes...")
+    create_ann_indexes(cur)
+
     conn.commit()
     print("SUCCESS: Database is populated and ready.")
 
 except Exception as e:
     print(f"ERROR: {e}")
 finally:
-    if 'conn' in locals(): conn.close()
\ No newline at end of file
+    if 'conn' in locals(): conn.close()
@@ -0,0 +1,106 @@
+import re
+import hashlib
+import psycopg2
+from psycopg2.extras import execute_values
+
+DB_PARAMS = {
+    "dbname": "postgres",
+    "user": "postgres",
+    "password": "mysecretpassword",
+    "host": "localhost",
+    "port": "5432"
+}
+
+SECTIONS = [
+    "Account Overview", "Last Year Assessment", "Strategic Position Diagnosis", "Account Intelligence",
+    "Internal Changes", "Growth Strategy", "Risks & Concerns", "Action Plan"
+]
+LEVELS = ["Streamlined", "Guided", "Comprehensive"]
+
+def infer_metadata(chunk_text):
+    """Section and help level a chunk is about, or None when it mentions none or several."""
+    lowered = chunk_text.lower()
+    sections = [s for s in SECTIONS if s.lower() in lowered]
+    levels = [l for l in LEVELS if re.search(rf"\b{l.lower()}\b", lowered)]
+    return (sections[0] if len(sections) == 1 else None), (levels[0] if len(levels) == 1 else None)
+
+def index_name(*parts):
+    return "knowledge_chunks_hnsw_" + hashlib.md5("|".join(parts).encode()).hexdigest()[:12]
+
+def create_ann_indexes(cur):
+    # One partial ANN index per tenant, per section and per (tenant, section), so a
+    # filtered search only walks the graph of its own partition.
+    cur.execute("SELECT DISTINCT tenant, section FROM knowledge_chunks")
+    partitions = cur.fetchall()
+    for tenant in sorted({t for t, _ in partitions}):
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name(tenant)} ON knowledge_chunks "
+            "USING hnsw (embedding vector_cosine_ops) WHERE tenant = %s",
+            (tenant,)
+        )
+    for section in sorted({sec for _, sec in partitions if sec is not None}):
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name('*', section)} ON knowledge_chunks "
+            "USING hnsw (embedding vector_cosine_ops) WHERE section = %s",
+            (section,)
+        )
+    for tenant, section in partitions:
+        if section is None: continue
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name(tenant, section)} ON knowledge_chunks "
+            "USING hnsw (embedding vector_cosine_ops) WHERE tenant = %s AND section = %s",
+            (tenant, section)
+        )
+
+def migrate(cur):
+    """Bring knowledge_chunks up to the current schema. Safe to run any number of times.
+
+    Adds the metadata columns, tags untagged rows from their content and builds the
+    filter and partial ANN indexes. Existing chunks are never re-inserted.
+    """
+    cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS knowledge_chunks (
+            id bigserial PRIMARY KEY,
+            content text,
+            embedding vector(1024)
+        );
+    """)
+    cur.execute("""
+        ALTER TABLE knowledge_chunks
+            ADD COLUMN IF NOT EXISTS tenant text NOT NULL DEFAULT 'default',
+            ADD COLUMN IF NOT EXISTS source_doc text,
+            ADD COLUMN IF NOT EXISTS section text,
+            ADD COLUMN IF NOT EXISTS help_level text;
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS knowledge_chunks_metadata_idx
+            ON knowledge_chunks (tenant, section, help_level, source_doc);
+    """)
+
+    cur.execute("SELECT id, content FROM knowledge_chunks WHERE section IS NULL AND help_level IS NULL")
+    tagged = [(row_id, *infer_metadata(content or "")) for row_id, content in cur.fetchall()]
+    tagged = [row for row in tagged if row[1] or row[2]]
+    if tagged:
+        execute_values(
+            cur,
+            """UPDATE knowledge_chunks AS k SET section = v.section, help_level = v.help_level
+               FROM (VALUES %s) AS v (id, section, help_level) WHERE k.id = v.id""",
+            tagged
+        )
+    create_ann_indexes(cur)
+    return len(tagged)
+
+if __name__ == "__main__":
+    try:
+        print("Connecting to Database...")
+        conn = psycopg2.connect(**DB_PARAMS)
+        cur = conn.cursor()
+        print("Migrating knowledge_chunks...")
+        tagged = migrate(cur)
+        conn.commit()
+        print(f"SUCCESS: knowledge_chunks is up to date ({tagged} rows tagged).")
+    except Exception as e:
+        print(f"ERROR: {e}")
+    finally:
+        if 'conn' in locals(): conn.close()
@@ -0,0 +1,228 @@
+"""Offline end-to-end benchmarks against local stand-in services.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import metrics
+import Chat_pipeline as pipeline
+from benchmarks.stand_ins import StandInServer, InMemoryKnowledgeBase, QUESTIONS_PER_LEVEL
+
+APP_PATH = os.path.join(ROOT, "streamlit_UI.py")
+SECTIONS = [
+    "Account Overview", "Last Year Assessment", "Strategic Position Diagnosis", "Account Intelligence",
+    "Internal Changes", "Growth Strategy", "Risks & Concerns", "Action Plan",
+]
+ANSWERS = [
+    "Revenue last year was about $12M, up 8% on the year before.",
+    "Our main sponsor is Jane Doe, the CIO, and she controls the platform budget.",
+    "We delivered the data migration and the analytics rollout on time.",
+    "Globex is pushing hard on price in the infrastructure renewals.",
+    "They are reorganising procurement and centralising vendor decisions.",
+    "The next opportunity is the customer-support automation programme.",
+]
+
+def latency_stats(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max": ordered[-1],
+    }
+
+def _stage_key(row):
+    # Errored runs are reported next to, not instead of, the successful ones.
+    key = row.get("stage", row.get("call"))
+    outcome = row.get("outcome", "ok")
+    return key if outcome == "ok" else f"{key}:{outcome}"
+
+def stage_stats(name="stage_latency_seconds"):
+    return {
+        _stage_key(row): {k: row[k] for k in ("count", "mean", "p50", "p95")}
+        for row in metrics.registry.summary()["histograms"] if row["name"] == name
+    }
+
+def synthetic_corpus(n_chunks):
+    chunks = []
+    for sec in SECTIONS:
+        for level, n in QUESTIONS_PER_LEVEL.items():
+            questions = "\n".join(f"* {sec} question {i + 1} for {level}?" for i in range(n))
+            meta = {"tenant": "default", "section": sec, "help_level": level, "source_doc": "bench"}
+            chunks.append((f"PLANNING PROMPTS {sec} {level} HELP\n{questions}", meta))
+    i = 0
+    while len(chunks) < n_chunks:
+        sec = SECTIONS[i % len(SECTIONS)]
+        meta = {"tenant": f"tenant-{i % 4}", "section": sec, "help_level": None, "source_doc": "bench"}
+        chunks.append((f"Playbook note {i}: {sec} guidance on stakeholders, pricing and renewals.", meta))
+        i += 1
+    return chunks
+
+def bench_chunking(server, paragraphs):
+    import anthropic
+    from semantic_chunking import chunk_document
+
+    kb_text = "\n".join(f"Paragraph {i}: {ANSWERS[i % len(ANSWERS)]}" for i in range(paragraphs))
+    client = anthropic.Anthropic(api_key="bench", base_url=server.base_url)
+    start = time.perf_counter()
+    chunks = chunk_document(kb_text, client)
+    return {"paragraphs": paragraphs, "chunks": len(chunks), "seconds": time.perf_counter() - start}
+
+def bench_ingestion(kb, corpus):
+    async def embed_all():
+        return await asyncio.gather(*(pipeline.get_embedding_async(c) for c, _ in corpus))
+
+    start = time.perf_counter()
+    vectors = pipeline.run_sync(embed_all())
+    embedded = time.perf_counter()
+    kb.insert([(c, v, meta) for (c, meta), v in zip(corpus, vectors) if v])
+    done = time.perf_counter()
+    return {
+        "chunks": len(corpus),
+        "embed_seconds": embedded - start,
+        "insert_seconds": done - embedded,
+        "chunks_per_second": len(corpus) / (done - start) if done > start else None,
+    }
+
+def bench_retrieval(queries, concurrency, filtered=False):
+    async def timed(q):
+        start = time.perf_counter()
+        filters = {"section": q.split(" HELP")[0].split("PROMPTS ")[1].rsplit(" ", 1)[0], "help_level": "Guided"} if filtered else {}
+        await pipeline.retrieve_context_async(q, **filters)
+        return time.perf_counter() - start
+
+    async def run_all():
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(q):
+            async with sem:
+                return await timed(q)
+
+        return await asyncio.gather(*(one(q) for q in queries))
+
+    start = time.perf_counter()
+    samples = pipeline.run_sync(run_all())
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency, "filtered": filtered,
+        "queries_per_second": len(queries) / elapsed, **latency_stats(samples),
+    }
+
+def bench_interview(level, export_runs, max_turns, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    metrics.registry.reset()
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    start = time.perf_counter()
+    at.run()
+    startup = time.perf_counter() - start
+
+    turns = []
+
+    def say(text):
+        t0 = time.perf_counter()
+        at.chat_input[0].set_value(text).run()
+        turns.append(time.perf_counter() - t0)
+
+    say("Acme Corp")
+    say(level)
+    i = 0
+    while not at.session_state["plan_generated"] and len(turns) < max_turns:
+        say(ANSWERS[i % len(ANSWERS)])
+        i += 1
+    completed = bool(at.session_state["plan_generated"])
+    interview_stages = stage_stats()
+
+    metrics.registry.reset()
+    for _ in range(export_runs):
+        at.run()
+    exporters = {k: v for k, v in stage_stats().items() if k.split(":")[0] in ("docx", "pdf", "pptx")}
+
+    return {
+        "completed": completed,
+        "errors": [str(e.value) for e in at.exception],
+        "startup_seconds": startup,
+        "turns": len(turns),
+        "turn_latency": latency_stats(turns[:-1]),
+        "final_turn_seconds": turns[-1] if completed else None,
+        "total_seconds": sum(turns),
+        "stages": interview_stages,
+        "exporters": exporters,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", nargs="+", default=list(QUESTIONS_PER_LEVEL))
+    parser.add_argument("--chat-latency", type=float, default=0.05, help="fixed seconds per chat call")
+    parser.add_argument("--token-rate", type=float, default=400.0, help="completion tokens per second")
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--plan-words", type=int, default=3000)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--export-runs", type=int, default=3)
+    parser.add_argument("--max-turns", type=int, default=80)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["chunking", "retrieval", "interviews"])
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="account-plan-bench-")
+    os.environ["SESSION_DB_PATH"] = os.path.join(tmp, "sessions.db")
+
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": vars(args),
+    }
+    kb = InMemoryKnowledgeBase()
+    kb.install(pipeline)
+
+    with StandInServer(args.chat_latency, args.token_rate, args.embedding_latency, args.plan_words) as server:
+        pipeline.CONFIG.update(
+            chat_url=f"{server.base_url}/v1/chat/completions",
+            emb_url=f"{server.base_url}/v1/embeddings",
+            maple_key="bench",
+            voyage_key="bench",
+        )
+        if "chunking" not in args.skip:
+            results["chunking"] = bench_chunking(server, args.paragraphs)
+        results["ingestion"] = bench_ingestion(kb, synthetic_corpus(args.chunks))
+        if "retrieval" not in args.skip:
+            queries = [f"PLANNING PROMPTS {SECTIONS[i % len(SECTIONS)]} Guided HELP {i}" for i in range(args.queries)]
+            results["retrieval"] = bench_retrieval(queries, args.concurrency)
+            results["retrieval_filtered"] = bench_retrieval(queries, args.concurrency, filtered=True)
+        if "interviews" not in args.skip:
+            results["interviews"] = {
+                level: bench_interview(level, args.export_runs, args.max_turns, args.timeout)
+                for level in args.levels
+            }
+        results["upstream_requests"] = server.requests
+
+    out = json.dumps(results, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+if __name__ == "__main__":
+    main()
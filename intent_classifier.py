@@ -0,0 +1,190 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import defaultdict
+import metrics
+
+# Minimum confidence for a local answer; anything below is escalated to the LLM.
+CONFIDENCE_THRESHOLD = float(os.getenv("FAST_CLASSIFIER_THRESHOLD", "0.85"))
+# Inputs this far from every labelled example are treated as ordinary answers in the interview.
+VALID_MAX_SIMILARITY = float(os.getenv("FAST_CLASSIFIER_VALID_MAX_SIM", "0.35"))
+KNN_K = 3
+
+GREETING = r"(hi|hii|hello|hey|hiya|howdy|yo|greetings|good (morning|afternoon|evening|day))( there| team| all| everyone)?"
+SOCIAL = (
+    r"((hi|hello|hey) )?(how are you( doing)?( today)?|how r u|hows it going|how is it going|how have you been"
+    r"|hope you are (doing )?(well|good|fine)|hope youre (doing )?(well|good|fine)|how are things|whats up|sup)"
+)
+STOP = (
+    r"((ok|okay|ok so|i think|i guess) )?(thats all|that is all|thats it|that is it|done|im done|i am done|were done"
+    r"|we are done|all done|generate( the)?( plan| report| account plan)?( now)?|no more (info|information)"
+    r"|nothing (else|more))( for now)?( thanks| thank you)?"
+)
+COMPANY_SUFFIX = re.compile(
+    r"\b(inc|corp|corporation|co|ltd|llc|llp|plc|gmbh|ag|sa|bv|group|holdings|technologies|systems|labs|bank|partners)$"
+)
+KEYBOARD_MASH = re.compile(r"^(asdf|qwer|zxcv|sdfg|hjkl|jkl)[a-z]*$")
+
+RULES = {
+    "name": [
+        (re.compile(f"^{SOCIAL}$"), "social_query", 0.97),
+        (re.compile(f"^{GREETING}$"), "simple_greeting", 0.97),
+    ],
+    "interview": [
+        (re.compile(f"^{STOP}$"), "stop", 0.95),
+        (re.compile(f"^({GREETING}|{SOCIAL})$"), "greeting", 0.95),
+    ],
+}
+
+EXAMPLES = {
+    "name": {
+        "social_query": [
+            "how are you", "how are you doing today", "hope you are doing well", "how is your day going",
+            "how have you been", "how are things going", "are you doing ok", "how is everything",
+        ],
+        "simple_greeting": [
+            "hi", "hello", "hey there", "good morning", "good afternoon", "good evening", "greetings",
+            "hello there", "hi team", "morning",
+        ],
+    },
+    "interview": {
+        "stop": [
+            "thats all", "i am done", "done", "generate the plan", "no more info", "nothing else to add",
+            "that is everything", "please generate the report", "we can finish here", "im finished",
+            "that covers it", "go ahead and generate",
+        ],
+        "greeting": [
+            "hi", "hello", "how are you", "hey there", "good morning", "how is it going",
+        ],
+    },
+}
+
+def normalize(text):
+    text = text.lower().replace("'", "").replace("’", "")
+    text = re.sub(r"[^a-z0-9&]+", " ", text)
+    text = re.sub(r"(.)\1{2,}", r"\1", text)
+    return " ".join(text.split())
+
+def _vector(text):
+    padded = f"  {text} "
+    counts = defaultdict(float)
+    for i in range(len(padded) - 2):
+        counts[padded[i:i + 3]] += 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+def _cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+class _Index:
+    def __init__(self, examples):
+        self.items = [(label, _vector(normalize(ex))) for label, exs in examples.items() for ex in exs]
+
+    def nearest(self, vec, k=KNN_K):
+        scored = sorted(((_cosine(vec, v), label) for label, v in self.items), reverse=True)[:k]
+        if not scored:
+            return None, 0.0, 0.0
+        votes = defaultdict(float)
+        for sim, label in scored:
+            votes[label] += sim
+        label = max(votes, key=votes.get)
+        total = sum(votes.values()) or 1.0
+        top = max(sim for sim, l in scored if l == label)
+        return label, top * votes[label] / total, scored[0][0]
+
+_indexes = {task: _Index(examples) for task, examples in EXAMPLES.items()}
+_stats = defaultdict(lambda: {"rule": 0, "knn": 0, "heuristic": 0, "escalated": 0})
+_stats_lock = threading.Lock()
+
+def _heuristic(task, norm):
+    words = norm.split()
+    if task == "name":
+        if not re.search(r"[a-z]", norm):
+            return "gibberish", 0.9
+        # Acronyms and single letters (KPMG, HSBC, X) are real names; only keyboard mash is answered here.
+        if len(words) == 1 and KEYBOARD_MASH.match(norm):
+            return "gibberish", 0.9
+        if 1 < len(words) <= 6 and COMPANY_SUFFIX.search(norm):
+            return "name", 0.95
+    return None, 0.0
+
+def classify(task, text, threshold=None):
+    """Return (label, confidence, source) for `task` ("name" or "interview").
+
+    `label` is None when no tier is confident enough and the caller should ask the LLM.
+    """
+    threshold = CONFIDENCE_THRESHOLD if threshold is None else threshold
+    start = time.perf_counter()
+    norm = normalize(text)
+    label, confidence, source = None, 0.0, None
+
+    for pattern, rule_label, rule_conf in RULES.get(task, []):
+        if pattern.match(norm):
+            label, confidence, source = rule_label, rule_conf, "rule"
+            break
+
+    if label is None:
+        label, confidence = _heuristic(task, norm)
+        source = "heuristic" if label else None
+
+    if label is None:
+        knn_label, knn_conf, top_sim = _indexes[task].nearest(_vector(norm))
+        confidence = knn_conf
+        if knn_conf >= threshold:
+            label, source = knn_label, "knn"
+        elif task == "interview" and top_sim < VALID_MAX_SIMILARITY and len(norm.split()) >= 4:
+            label, confidence, source = "valid", 1.0 - top_sim, "knn"
+
+    if label is not None and confidence < threshold:
+        label, source = None, None
+
+    outcome = source or "escalated"
+    with _stats_lock:
+        _stats[task][outcome] += 1
+    metrics.inc("fast_classify", task=task, outcome=outcome, label=label or "none")
+    metrics.observe("fast_classify_seconds", time.perf_counter() - start, task=task)
+    return label, confidence, source
+
+def fast_classify(task, text, threshold=None):
+    return classify(task, text, threshold)[0]
+
+def hit_rates():
+    with _stats_lock:
+        out = {}
+        for task, counts in _stats.items():
+            total = sum(counts.values())
+            hits = total - counts["escalated"]
+            out[task] = {**counts, "total": total, "hit_rate": hits / total if total else None}
+        return out
+
+# Inputs that must keep the same local answer; None means the LLM has to decide.
+CHECKS = [
+    ("name", "KPMG", None),
+    ("name", "HSBC", None),
+    ("name", "TSMC", None),
+    ("name", "X", None),
+    ("name", "3M", None),
+    ("name", "Qwerty Labs", "name"),
+    ("name", "Acme Corp", "name"),
+    ("name", "asdfgh", "gibberish"),
+    ("name", "hello there", "simple_greeting"),
+    ("name", "how are you", "social_query"),
+    ("interview", "end", None),
+    ("interview", "finish", None),
+    ("interview", "no more", None),
+    ("interview", "that's all", "stop"),
+    ("interview", "generate the plan", "stop"),
+    ("interview", "hi", "greeting"),
+]
+
+if __name__ == "__main__":
+    failures = [(task, text, expected, got) for task, text, expected in CHECKS
+                if (got := fast_classify(task, text)) != expected]
+    for task, text, expected, got in failures:
+        print(f"{task}: {text!r} -> {got!r}, expected {expected!r}")
+    print(f"{len(CHECKS) - len(failures)}/{len(CHECKS)} checks passed")
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import atexit
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SAMPLE_WINDOW = 1000
+# When set, every recorded event is also appended to this file as one JSON object per line.
+JSONL_PATH = os.getenv("METRICS_JSONL_PATH")
+
+_current_stage = contextvars.ContextVar("metrics_stage", default="unknown")
+
+def current_stage():
+    return _current_stage.get()
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+        self.samples.append(value)
+
+    def quantile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Registry:
+    """Thread-safe counters and latency histograms keyed by name and labels."""
+
+    def __init__(self, jsonl_path=JSONL_PATH):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = defaultdict(_Histogram)
+        self.jsonl_path = jsonl_path
+        # One buffered handle with its own lock, so hot-path callers never wait on file I/O under _lock.
+        self._jsonl_lock = threading.Lock()
+        self._jsonl_file = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+        self._emit("counter", name, value, labels)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._histograms[key].observe(value)
+        self._emit("histogram", name, value, labels)
+
+    def _emit(self, kind, name, value, labels):
+        if not self.jsonl_path:
+            return
+        line = json.dumps({"ts": time.time(), "type": kind, "name": name, "value": value, "labels": labels})
+        with self._jsonl_lock:
+            if self._jsonl_file is None:
+                self._jsonl_file = open(self.jsonl_path, "a", encoding="utf-8")
+                atexit.register(self.flush)
+            self._jsonl_file.write(line + "\n")
+
+    def flush(self):
+        with self._jsonl_lock:
+            if self._jsonl_file is not None:
+                self._jsonl_file.flush()
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def summary(self):
+        """Per-histogram count, mean, p50 and p95, suitable for tables and JSON dumps."""
+        with self._lock:
+            rows = []
+            for (name, labels), h in sorted(self._histograms.items()):
+                rows.append({
+                    "name": name, **dict(labels),
+                    "count": h.count,
+                    "mean": h.total / h.count if h.count else None,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                })
+            counters = [{"name": name, **dict(labels), "value": v} for (name, labels), v in sorted(self._counters.items())]
+        return {"histograms": rows, "counters": counters}
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self):
+        def fmt(labels, **extra):
+            items = list(labels) + list(extra.items())
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+        lines = []
+        with self._lock:
+            for (name, labels), v in sorted(self._counters.items()):
+                lines.append(f"{name}_total{fmt(labels)} {v}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, c in zip(LATENCY_BUCKETS, h.counts):
+                    cumulative += c
+                    lines.append(f"{name}_bucket{fmt(labels, le=bound)} {cumulative}")
+                lines.append(f'{name}_bucket{fmt(labels, le="+Inf")} {h.count}')
+                lines.append(f"{name}_sum{fmt(labels)} {h.total}")
+                lines.append(f"{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+def record_call(call, seconds, error=None, **labels):
+    """Latency and outcome of one upstream call, tagged with the current stage."""
+    labels.setdefault("stage", current_stage())
+    observe("call_latency_seconds", seconds, call=call, **labels)
+    if error is not None:
+        inc("call_errors", call=call, error=error, **labels)
+
+@contextmanager
+def tagged(name):
+    """Tag upstream calls made inside the block with `name` without timing it."""
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+@contextmanager
+def stage(name):
+    """Tag upstream calls made inside the block with `name` and time the block.
+
+    Also usable as a function decorator.
+    """
+    token = _current_stage.set(name)
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except Exception as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        observe("stage_latency_seconds", time.perf_counter() - start, stage=name, outcome=outcome)
+        _current_stage.reset(token)
@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import time
+import threading
+import metrics
+from Chat_pipeline import llm_chat_async, submit
+
+# Rough input budget per section of the final prompt, in tokens.
+SECTION_TOKEN_BUDGET = int(os.getenv("SECTION_TOKEN_BUDGET", "600"))
+CHARS_PER_TOKEN = 4
+# Bullet notes run about 7 characters per word, so roughly 2 estimated tokens per word.
+CHARS_PER_WORD = 7
+# Finished background summaries that nobody collects (abandoned sessions) are dropped after this many seconds.
+PENDING_TTL = 3600
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "our", "their", "its", "it", "we", "they",
+    "of", "to", "in", "on", "for", "and", "or", "with", "at", "by", "as", "that", "this", "has",
+    "have", "had", "about", "around", "approximately", "answer", "currently", "from",
+}
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+def compact_account_data(account_data):
+    data = {k: v for k, v in account_data.items() if v not in (None, "", "None", "N/A")}
+    return json.dumps(data, separators=(", ", ": "), ensure_ascii=False)
+
+def _words(text):
+    words = (w.strip(".") for w in re.findall(r"[a-z0-9$%.]+", text.lower().replace(",", "")))
+    return [w for w in words if w and w not in STOPWORDS]
+
+def _sentences(text):
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", text) if s.strip()]
+
+def dedupe_facts(text, account_data, seen=None):
+    """Drop sentences already captured in account_data or earlier in the transcript."""
+    known = set()
+    for k, v in account_data.items():
+        if v:
+            known.update(_words(f"{k} {v}"))
+    seen = set() if seen is None else seen
+    kept = []
+    for sent in _sentences(text):
+        norm = " ".join(_words(sent))
+        if not norm or norm in seen:
+            continue
+        seen.add(norm)
+        if set(norm.split()) <= known:
+            continue
+        kept.append(sent)
+    return " ".join(kept)
+
+def truncate_to_budget(text, budget=SECTION_TOKEN_BUDGET):
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut + " [...]"
+
+async def summarize_section(section, previous_summary, new_answers, budget=SECTION_TOKEN_BUDGET):
+    # Aim well under the budget so the next few answers fit before summarizing again.
+    target_chars = budget // 2 * CHARS_PER_TOKEN
+    prompt = f"""
+    Section: {section}
+    Existing notes:
+    {previous_summary or "(none)"}
+
+    New interview answers:
+    {chr(10).join(new_answers)}
+
+    Task: Merge the new answers into the existing notes as concise bullet points.
+    Keep every concrete fact (names, numbers, dates, competitors, goals). Drop filler and repetition.
+    Stay under {target_chars // CHARS_PER_WORD} words ({target_chars} characters). Output the notes only.
+    """
+    with metrics.tagged("summarize"):
+        return await llm_chat_async([{"role": "user", "content": prompt}], temperature=0.0)
+
+# In-flight summaries per (session_id, section): (future, answers it covers, submitted at)
+_pending = {}
+_pending_lock = threading.Lock()
+
+def collect_summaries(session_id, section_summaries, wait=False):
+    """Fold finished background summaries into `section_summaries`; with `wait`, block on in-flight ones first."""
+    with _pending_lock:
+        mine = [(key, entry) for key, entry in _pending.items() if key[0] == session_id]
+    for key, (future, covered, _) in mine:
+        if not (wait or future.done()):
+            continue
+        try:
+            summary = future.result()
+        except Exception:
+            summary = None
+        with _pending_lock:
+            _pending.pop(key, None)
+        if summary:
+            section_summaries.setdefault(key[1], {}).update(summary=summary.strip(), covered=covered)
+    return section_summaries
+
+def update_section_summary(session_id, section, answers, section_summaries, budget=SECTION_TOKEN_BUDGET):
+    """Start folding newly arrived answers into the running summary once a section outgrows its budget.
+
+    `section_summaries[section]` is {"summary": str, "covered": int}. The model call runs in
+    the background and only sees the answers past `covered`; `collect_summaries` picks up
+    the result on a later turn.
+    """
+    collect_summaries(session_id, section_summaries)
+    with _pending_lock:
+        if (session_id, section) in _pending:
+            return section_summaries
+    state = section_summaries.get(section, {})
+    pending = answers[state.get("covered", 0):]
+    if not pending:
+        return section_summaries
+    size = estimate_tokens(state.get("summary", "")) + sum(estimate_tokens(a) for a in pending)
+    if size <= budget:
+        return section_summaries
+    future = submit(summarize_section(section, state.get("summary", ""), pending, budget))
+    now = time.monotonic()
+    with _pending_lock:
+        for key, (f, _, submitted) in list(_pending.items()):
+            if f.done() and now - submitted > PENDING_TTL:
+                del _pending[key]
+        _pending[(session_id, section)] = (future, len(answers), now)
+    return section_summaries
+
+def build_transcript(sections, section_history, section_summaries, account_data, budget=SECTION_TOKEN_BUDGET):
+    seen = set()
+    parts = []
+    for sec in sections:
+        state = section_summaries.get(sec, {})
+        answers = section_history.get(sec, [])
+        raw = "\n".join(answers[state.get("covered", 0):])
+        body = "\n".join(t for t in (state.get("summary", ""), dedupe_facts(raw, account_data, seen)) if t)
+        parts.append(f"SECTION: {sec}\n{truncate_to_budget(body, budget)}\n\n")
+    return "".join(parts)
@@ -0,0 +1,238 @@
+import re
+import json
+import asyncio
+import time
+import hashlib
+import threading
+from datetime import date
+import metrics
+from Chat_pipeline import llm_chat_async, run_sync, submit
+from prompt_compaction import build_transcript, compact_account_data
+
+FLOW_LINE = "FLOW: Analyze Requirements -> Develop Strategy -> Present Proposal -> Close Deal"
+# account_data keys every block reads through the metadata header.
+BASE_DEPS = ("Account Name", "Tier", "Help Level")
+
+def plan_header(account_data, today_str=None, client=None):
+    today_str = today_str or date.today().strftime("%B %d, %Y")
+    help_level = account_data.get('Help Level', 'Comprehensive')
+    return f"""
+    **Client Company** : {client or '[Insert Name]'}
+    **Account Name** : {account_data.get('Account Name')}
+    **Planning Depth** : {help_level}
+    **Date** : {today_str}
+    """
+
+def plan_blocks(account_data):
+    """The STRICT OUTPUT FORMAT of the final plan, one block per heading.
+
+    Each entry is (key, interview section the block is drafted after, extra account_data keys it reads, text).
+    """
+    return [
+        ("overview", "Account Overview", ("Contact", "Revenue"), f"""
+    # 1. ACCOUNT OVERVIEW
+    * **Key Characteristics** : (Write 150-200 words analyzing market position).
+    * **Primary Contact** : {account_data.get('Contact', 'Not Provided')} (Write 150 words on influence).
+    * **Financial History** : (Write 150 words on 3-year trend).
+    * **Past Key Projects** : (Write 150 words).
+    * **Coming Year Revenue Target** : {account_data.get('Revenue', 'Extract from transcript')} (Write 150 words justifying target).
+    """),
+        ("last_year", "Last Year Assessment", (), """
+    # 2. LAST YEAR ASSESSMENT
+    * **Completed Initiatives** : (Write 150 words).
+    * **Missed Opportunities** : (Write 150 words).
+    * **Strategic Hits** : (Write 150 words).
+    * **Strategic Misses** : (Write 150 words).
+    """),
+        ("position", "Strategic Position Diagnosis", (), """
+    # 3. STRATEGIC POSITION DIAGNOSIS
+    * **Current Position** : (Write 200 words).
+    * **Growth Constraint** : (Write 200 words).
+    """),
+        ("intelligence", "Account Intelligence", (), """
+    # 4. ACCOUNT INTELLIGENCE
+    * **Strategic Direction** : (Write 200 words).
+    * **Leadership & Org** : (Write 200 words).
+    """),
+        ("internal", "Internal Changes", (), """
+    # 5. INTERNAL CHANGES
+    * **Internal Changes** : (Write 200 words).
+    * **Opportunities** : (Write 200 words).
+    """),
+        ("growth", "Growth Strategy", (), """
+    # 6. GROWTH STRATEGY
+    * **Next Beachhead Opportunity** : (Write 200 words).
+    * **Proof Points Needed** : (Write 200 words).
+    """),
+        ("stakeholders", "Account Intelligence", ("Contact", "Stakeholders"), """
+    # 4. STAKEHOLDER & RELATIONSHIP MAP
+    | Name | Role | Influence | Strategy |
+    """),
+        ("risks", "Risks & Concerns", ("Competitors",), f"""
+    # 7. RISKS & CONCERNS
+    * **Relationship Risks** : (Write 200 words).
+    * **Competitive Risks** : {account_data.get('Competitors', 'Extract from transcript')} (Write 200 words).
+    """),
+        ("actions", "Action Plan", (), """
+    # 8. ACTION PLAN
+    * **Full Year Key Actions** : (Write 200 words).
+    * **Q1 Key Actions** : (Write 200 words).
+    """),
+    ]
+
+def plan_layout(account_data, today_str=None):
+    blocks = "".join(text for _, _, _, text in plan_blocks(account_data))
+    return plan_header(account_data, today_str) + blocks + f"\n    {FLOW_LINE}\n"
+
+def _fingerprint(account_data, keys):
+    snapshot = {k: account_data.get(k) for k in sorted(keys)}
+    return hashlib.sha256(json.dumps(snapshot, sort_keys=True, default=str).encode()).hexdigest()
+
+def _deps(extra):
+    # Only the keys a block reads; changes elsewhere in account_data are left to the consistency pass.
+    return sorted(set(BASE_DEPS) | set(extra))
+
+def _draft_prompt(block, section, account_data, section_transcript):
+    today_str = date.today().strftime("%B %d, %Y")
+    return f"""
+    You are a Senior Account Strategist drafting one part of a **Final Account Plan**.
+
+    ### EXTRACTED DATA:
+    {compact_account_data(account_data)}
+
+    ### TRANSCRIPT ({section}):
+    {section_transcript}
+
+    ### METADATA:
+    * **Client**: {account_data.get('Account Name')}
+    * **Tier**: {account_data.get('Tier')}
+    * **Date**: {today_str}
+    * **Help Level**: {account_data.get('Help Level', 'Comprehensive')}
+
+    Write ONLY this part of the plan in Markdown, keeping the heading and bullet labels exactly:
+    {block}
+    """
+
+async def _draft_block(prompt):
+    with metrics.tagged("draft"):
+        return await llm_chat_async([{"role": "user", "content": prompt}], temperature=0.3)
+
+# Finished drafts that nobody collects (abandoned sessions) are dropped after this many seconds.
+PENDING_TTL = 3600
+
+# In-flight drafts per (session_id, block key): (future, {"deps", "fingerprint"}, submitted at)
+_pending = {}
+_pending_lock = threading.Lock()
+
+def collect(session_id, drafts):
+    """Move finished background drafts into `drafts` ({key: {"text", "deps", "fingerprint"}})."""
+    with _pending_lock:
+        for (sid, key), (future, entry, _) in list(_pending.items()):
+            if sid != session_id or not future.done():
+                continue
+            del _pending[(sid, key)]
+            try:
+                text = future.result()
+            except Exception:
+                text = None
+            if text:
+                drafts[key] = {**entry, "text": text.strip()}
+    return drafts
+
+def invalidate(session_id, drafts, account_data, section_history, section_summaries):
+    """Redraft, in the background, every draft (or in-flight draft) whose account_data dependencies changed."""
+    stale = {key for key, entry in drafts.items() if _fingerprint(account_data, entry["deps"]) != entry["fingerprint"]}
+    with _pending_lock:
+        stale |= {
+            key for (sid, key), (_, entry, _) in _pending.items()
+            if sid == session_id and _fingerprint(account_data, entry["deps"]) != entry["fingerprint"]
+        }
+    owners = {owner for key, owner, _, _ in plan_blocks(account_data) if key in stale}
+    for section in owners:
+        start_section_drafts(session_id, section, account_data, section_history, section_summaries, drafts, keys=stale)
+    return drafts
+
+def start_section_drafts(session_id, section, account_data, section_history, section_summaries, drafts, keys=None):
+    """Draft, in the background, every plan block (or just `keys`) that becomes writable once `section` is answered."""
+    collect(session_id, drafts)
+    transcript = build_transcript([section], section_history, section_summaries, account_data)
+    for key, owner, extra, block in plan_blocks(account_data):
+        if owner != section or (keys is not None and key not in keys):
+            continue
+        deps = _deps(extra)
+        entry = {"deps": deps, "fingerprint": _fingerprint(account_data, deps)}
+        prompt = _draft_prompt(block, section, account_data, transcript)
+        now = time.monotonic()
+        with _pending_lock:
+            for pending_key, (future, _, submitted) in list(_pending.items()):
+                if future.done() and now - submitted > PENDING_TTL:
+                    del _pending[pending_key]
+            previous = _pending.pop((session_id, key), None)
+            if previous:
+                previous[0].cancel()
+            _pending[(session_id, key)] = (submit(_draft_block(prompt)), entry, now)
+        drafts.pop(key, None)
+
+def _consistency_pass(plan, account_data):
+    prompt = f"""
+    Extracted account data:
+    {compact_account_data(account_data)}
+
+    Account plan (drafted section by section):
+    {plan}
+
+    Task: Find factual contradictions between sections, or with the extracted data (names, numbers, dates, competitors).
+    Output JSON ONLY: {{"fixes": [{{"find": "exact text from the plan", "replace": "corrected text"}}]}}
+    If everything is consistent, return {{"fixes": []}}
+    """
+    async def check():
+        with metrics.tagged("consistency"):
+            return await llm_chat_async([{"role": "user", "content": prompt}], temperature=0.0, json_mode=True)
+
+    try:
+        res = run_sync(check())
+        fixes = json.loads(re.search(r'\{.*\}', res, re.DOTALL).group(0)).get("fixes", [])
+        for fix in fixes:
+            if fix.get("find") and fix.get("replace") is not None:
+                plan = plan.replace(fix["find"], fix["replace"], 1)
+    except Exception:
+        pass
+    return plan
+
+def assemble_plan(session_id, section_history, section_summaries, account_data, drafts):
+    """Wait for background drafts, draft whatever is still missing, and stitch the plan together.
+
+    Returns None if any block could not be drafted, so the caller can fall back to one-shot generation.
+    """
+    invalidate(session_id, drafts, account_data, section_history, section_summaries)
+    with _pending_lock:
+        waiting = [f for (sid, _), (f, _, _) in _pending.items() if sid == session_id]
+    for future in waiting:
+        try:
+            future.result()
+        except Exception:
+            pass
+    collect(session_id, drafts)
+
+    blocks = plan_blocks(account_data)
+    missing = [(key, owner, extra, block) for key, owner, extra, block in blocks if key not in drafts]
+
+    async def draft_missing():
+        prompts = [
+            _draft_prompt(block, owner, account_data,
+                          build_transcript([owner], section_history, section_summaries, account_data))
+            for _, owner, _, block in missing
+        ]
+        return await asyncio.gather(*(_draft_block(p) for p in prompts))
+
+    if missing:
+        for (key, _, extra, _), text in zip(missing, run_sync(draft_missing())):
+            if not text:
+                return None
+            deps = _deps(extra)
+            drafts[key] = {"deps": deps, "fingerprint": _fingerprint(account_data, deps), "text": text.strip()}
+
+    header = plan_header(account_data, client=account_data.get("Account Name"))
+    body = "\n\n".join(drafts[key]["text"] for key, _, _, _ in blocks)
+    plan = "\n".join(line.strip() for line in header.strip().splitlines()) + "\n\n" + body + "\n\n" + FLOW_LINE
+    return _consistency_pass(plan, account_data)
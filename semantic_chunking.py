@@ -1,4 +1,4 @@
-import os 
+import os
 import docx
 import pandas as pd
 import anthropic
@@ -6,14 +6,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-Claude_api_key = os.environ.get("CLAUDE_KEY")
-
-if not Claude_api_key:
-    print("claude api key not found.")
-    exit()
-
 Input_file = os.path.join("data", "input", "Knowledge Base.docx")
 Output_file = os.path.join("data", "output", "Semantic_chunk.csv")
+SEPARATOR = "||---CHUNK_BREAK---||"
 
 def read_docx(file_path):
     try:
@@ -25,15 +20,9 @@ def read_docx(file_path):
     except Exception as e:
         print(f"Error {file_path}: {e}")
         return None
-    
-kb_text = read_docx(Input_file)
-
-if kb_text:
-    print(f"Successfully read {Input_file}.")
-
-    separator = "||---CHUNK_BREAK---||"
 
-    claude_prompt = f"""
+def build_prompt(kb_text, separator=SEPARATOR):
+    return f"""
 You are an expert at processing and structuring documents.
 Your task is read the text and split into logical, contained chunks.
 
@@ -48,39 +37,57 @@ Tthe text:
 {kb_text}
 </document_text>
 """
-    try:
-        client = anthropic.Anthropic(api_key=Claude_api_key)
 
-        message = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=4096,
-            system="You are a document processing assistant.",
-            messages=[
-                {"role": "user", "content": claude_prompt}
-            ]
-        )
+def split_chunks(claude_response, separator=SEPARATOR):
+    split_chunks = claude_response.split(separator)
+    return [chunk.strip() for chunk in split_chunks if chunk.strip()]
+
+def chunk_document(kb_text, client, separator=SEPARATOR):
+    message = client.messages.create(
+        model="claude-3-haiku-20240307",
+        max_tokens=4096,
+        system="You are a document processing assistant.",
+        messages=[
+            {"role": "user", "content": build_prompt(kb_text, separator)}
+        ]
+    )
+    return split_chunks(message.content[0].text, separator)
+
+def main():
+    Claude_api_key = os.environ.get("CLAUDE_KEY")
+
+    if not Claude_api_key:
+        print("claude api key not found.")
+        exit()
 
-        claude_response = message.content[0].text
+    kb_text = read_docx(Input_file)
+
+    if not kb_text:
+        print(f"Could not read {Input_file}.")
+        return
+
+    print(f"Successfully read {Input_file}.")
+
+    try:
+        client = anthropic.Anthropic(api_key=Claude_api_key)
+        cleaned_chunks = chunk_document(kb_text, client)
         print("received response from Claude.")
-    
+
     except Exception as e:
         print(f"Error calling Claude API: {e}")
         exit()
 
     try:
-        split_chunks = claude_response.split(separator)
-        cleaned_chunks = [chunk.strip() for chunk in split_chunks if chunk.strip()]
-        
         print(f"Split the text into {len(cleaned_chunks)} chunks.")
 
         df = pd.DataFrame(cleaned_chunks, columns=["chunk_text"])
         os.makedirs(os.path.dirname(Output_file), exist_ok=True)
         df.to_csv(Output_file, index=False, encoding="utf-8")
-        
+
         print(f"Successfully saved {len(cleaned_chunks)} chunks to {Output_file}.")
-        
+
     except Exception as e:
         print(f"Error processing Claude response or saving to CSV: {e}")
-        
-else:
-    print(f"Could not read {Input_file}.")
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join("data", "sessions.db"))
+
+class SessionStore(ABC):
+    """Interface for persisting interview sessions outside of st.session_state."""
+
+    @abstractmethod
+    def create(self): ...
+
+    @abstractmethod
+    def load(self, session_id): ...
+
+    @abstractmethod
+    def save_state(self, session_id, state): ...
+
+    @abstractmethod
+    def append_message(self, session_id, role, content): ...
+
+    @abstractmethod
+    def append_answer(self, session_id, section, answer): ...
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed store with append-only message and answer logs.
+
+    Safe to share between threads and worker processes pointing at the same file.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection().executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS section_answers (
+                session_id TEXT NOT NULL,
+                section TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                answer TEXT NOT NULL,
+                PRIMARY KEY (session_id, section, seq)
+            );
+        """)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def _read(self):
+        # Deferred BEGIN: a consistent snapshot without taking the write lock.
+        return _Transaction(self._connection(), "BEGIN")
+
+    def create(self):
+        session_id = uuid.uuid4().hex
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO sessions (id, updated_at) VALUES (?, ?)", (session_id, time.time()))
+        return session_id
+
+    def load(self, session_id):
+        with self._read() as conn:
+            row = conn.execute("SELECT state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            history = {}
+            for section, answer in conn.execute(
+                "SELECT section, answer FROM section_answers WHERE session_id = ? ORDER BY section, seq",
+                (session_id,),
+            ):
+                history.setdefault(section, []).append(answer)
+            messages = conn.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return {
+            "state": json.loads(row[0]),
+            "messages": [{"role": role, "content": content} for role, content in messages],
+            "section_history": history,
+        }
+
+    def save_state(self, session_id, state):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE sessions SET state = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(state), time.time(), session_id),
+            )
+
+    def append_message(self, session_id, role, content):
+        with self._transaction() as conn:
+            conn.execute(
+                """INSERT INTO messages (session_id, seq, role, content)
+                   SELECT ?, COALESCE(MAX(seq), -1) + 1, ?, ? FROM messages WHERE session_id = ?""",
+                (session_id, role, content, session_id),
+            )
+
+    def append_answer(self, session_id, section, answer):
+        with self._transaction() as conn:
+            conn.execute(
+                """INSERT INTO section_answers (session_id, section, seq, answer)
+                   SELECT ?, ?, COALESCE(MAX(seq), -1) + 1, ? FROM section_answers
+                   WHERE session_id = ? AND section = ?""",
+                (session_id, section, answer, session_id, section),
+            )
+
+class _Transaction:
+    def __init__(self, conn, begin="BEGIN IMMEDIATE"):
+        self.conn = conn
+        self.begin = begin
+
+    def __enter__(self):
+        self.conn.execute(self.begin)
+        return self.conn
+
+    def __exit__(self, exc_type, *exc):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+def get_session_store():
+    return SQLiteSessionStore(SESSION_DB_PATH)
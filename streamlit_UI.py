@@ -1,6 +1,11 @@
 import streamlit as st
+import os
 import json
 import re
+import time
+import asyncio
+import importlib.util
+import metrics
 from io import BytesIO
 from datetime import date
 
@@ -18,20 +23,22 @@ SECTIONS = [
     "Action Plan"
 ]
 
+LEVELS = ["Streamlined", "Guided", "Comprehensive"]
+
+# The export libraries are only imported when a download is built; just check they are installed.
+for _module in ("docx", "fpdf", "pptx"):
+    if importlib.util.find_spec(_module) is None:
+        st.error(f"Missing Requirement: No module named '{_module}'")
+        st.stop()
+
+_import_start = time.perf_counter()
 try:
-    from docx import Document
-    from docx.shared import Pt, RGBColor
-    from docx.oxml.ns import qn
-    from docx.oxml import OxmlElement
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
-    from fpdf import FPDF
-    from pptx import Presentation
-    from pptx.util import Inches, Pt as PptxPt
-    from pptx.enum.shapes import MSO_SHAPE
-    from pptx.dml.color import RGBColor as PptxRGB
-    
     try:
-        from Chat_pipeline import llm_chat, retrieve_context
+        from Chat_pipeline import llm_chat, llm_chat_async, retrieve_context, retrieve_context_async, submit, warm_up_async
+        from session_store import get_session_store
+        from prompt_compaction import build_transcript, collect_summaries, compact_account_data, update_section_summary
+        from intent_classifier import fast_classify, hit_rates as classifier_hit_rates
+        from section_drafts import assemble_plan, invalidate as invalidate_drafts, plan_layout, start_section_drafts
     except Exception as e:
         st.error(f"Pipeline Error: {e}")
         st.stop()
@@ -39,8 +46,12 @@ try:
 except ImportError as e:
     st.error(f"Missing Requirement: {e}")
     st.stop()
+IMPORT_SECONDS = time.perf_counter() - _import_start
 
 def insert_horizontal_line(doc):
+    from docx.oxml.ns import qn
+    from docx.oxml import OxmlElement
+
     p = doc.add_paragraph()
     pPr = p._p.get_or_add_pPr()
     pBdr = OxmlElement('w:pBdr')
@@ -59,6 +70,10 @@ def clear_placeholders(slide):
             sp.getparent().remove(sp)
 
 def draw_process_flow(slide, steps, title_text):
+    from pptx.util import Inches, Pt as PptxPt
+    from pptx.enum.shapes import MSO_SHAPE
+    from pptx.dml.color import RGBColor as PptxRGB
+
     title = slide.shapes.title
     title.text = title_text
     clear_placeholders(slide)
@@ -92,6 +107,9 @@ def draw_process_flow(slide, steps, title_text):
             top += height + Inches(0.5)
 
 def draw_table_from_text(slide, title_text, table_lines):
+    from pptx.util import Inches, Pt as PptxPt
+    from pptx.dml.color import RGBColor as PptxRGB
+
     title = slide.shapes.title
     title.text = title_text
     clear_placeholders(slide)
@@ -126,7 +144,12 @@ def draw_table_from_text(slide, title_text, table_lines):
                     cell.text_frame.paragraphs[0].font.bold = True
                     cell.text_frame.paragraphs[0].font.color.rgb = PptxRGB(255, 255, 255)
 
+@metrics.stage("docx")
 def create_docx(text):
+    from docx import Document
+    from docx.shared import Pt, RGBColor
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
     doc = Document()
     title = doc.add_paragraph()
     title.alignment = WD_ALIGN_PARAGRAPH.LEFT
@@ -196,7 +219,10 @@ def create_docx(text):
     buffer.seek(0)
     return buffer
 
+@metrics.stage("pdf")
 def create_pdf(text):
+    from fpdf import FPDF
+
     class PDFObj(FPDF):
         def header(self): pass
         def footer(self):
@@ -240,7 +266,12 @@ def create_pdf(text):
         
     return pdf.output(dest='S').encode('latin-1')
 
+@metrics.stage("pptx")
 def create_pptx(text):
+    from pptx import Presentation
+    from pptx.util import Inches, Pt as PptxPt
+    from pptx.dml.color import RGBColor as PptxRGB
+
     prs = Presentation()
     title_slide = prs.slides.add_slide(prs.slide_layouts[0])
     title_slide.shapes.title.text = "Strategic Account Plan"
@@ -376,6 +407,7 @@ def create_pptx(text):
     buffer.seek(0)
     return buffer
 
+@metrics.stage("extract")
 def extract_smart_data(user_input):
     prompt = f"""
     Analyze input: "{user_input}"
@@ -391,6 +423,7 @@ def extract_smart_data(user_input):
                 st.session_state.account_data[k] = v
     except: pass
 
+@metrics.stage("prune")
 def prune_questions(queue, user_input):
     if not queue: return []
     queue_str = "\n".join([f"{i}. {q}" for i, q in enumerate(queue)])
@@ -408,9 +441,11 @@ def prune_questions(queue, user_input):
         return [q for i, q in enumerate(queue) if i not in indices]
     except: return queue
 
-def get_questions_for_section(section, level):
-    context = retrieve_context(f"PLANNING PROMPTS {section} {level} HELP")
-    prompt = f"""
+def questions_query(section, level):
+    return f"PLANNING PROMPTS {section} {level} HELP"
+
+def questions_prompt(section, level, context):
+    return f"""
     Context Chunk:
     {context}
     
@@ -421,12 +456,28 @@ def get_questions_for_section(section, level):
     2. Extract all bulleted questions.
     3. Output JSON list of strings.
     """
-    response = llm_chat([{"role": "user", "content": prompt}], temperature=0.0, json_mode=True)
+
+def parse_questions(response):
     try:
         return json.loads(re.search(r'\[.*\]', response, re.DOTALL).group(0))
     except:
         return []
 
+@metrics.stage("questions")
+def get_questions_for_section(section, level):
+    question_bank = warm_up()["questions"]
+    if question_bank.get((section, level)):
+        return list(question_bank[(section, level)])
+    context = retrieve_context(questions_query(section, level), section=section, help_level=level)
+    prompt = questions_prompt(section, level, context)
+    response = llm_chat(
+        [{"role": "user", "content": prompt}], temperature=0.0, json_mode=True,
+        cache_type="questions", cache_template=f"{section}|{level}",
+    )
+    questions = parse_questions(response)
+    if questions: question_bank[(section, level)] = list(questions)
+    return questions
+
 def get_system_prompt(account_data, transcript_data):
     today_str = date.today().strftime("%B %d, %Y")
     help_level = account_data.get('Help Level', 'Comprehensive')
@@ -434,7 +485,7 @@ def get_system_prompt(account_data, transcript_data):
     You are a Senior Account Strategist. Generate a **Final Account Plan**.
     
     ### EXTRACTED DATA:
-    {json.dumps(account_data, indent=2)}
+    {compact_account_data(account_data)}
     
     ### TRANSCRIPT:
     {transcript_data}
@@ -446,66 +497,106 @@ def get_system_prompt(account_data, transcript_data):
     * **Help Level**: {help_level}
     
     ### STRICT OUTPUT FORMAT (Markdown):
-    **Client Company** : [Insert Name]
-    **Account Name** : {account_data.get('Account Name')}
-    **Planning Depth** : {help_level}
-    **Date** : {today_str}
-    
-    # 1. ACCOUNT OVERVIEW
-    * **Key Characteristics** : (Write 150-200 words analyzing market position).
-    * **Primary Contact** : {account_data.get('Contact', 'Not Provided')} (Write 150 words on influence).
-    * **Financial History** : (Write 150 words on 3-year trend).
-    * **Past Key Projects** : (Write 150 words).
-    * **Coming Year Revenue Target** : {account_data.get('Revenue', 'Extract from transcript')} (Write 150 words justifying target).
-    
-    # 2. LAST YEAR ASSESSMENT
-    * **Completed Initiatives** : (Write 150 words).
-    * **Missed Opportunities** : (Write 150 words).
-    * **Strategic Hits** : (Write 150 words).
-    * **Strategic Misses** : (Write 150 words).
-    
-    # 3. STRATEGIC POSITION DIAGNOSIS
-    * **Current Position** : (Write 200 words).
-    * **Growth Constraint** : (Write 200 words).
-    
-    # 4. ACCOUNT INTELLIGENCE
-    * **Strategic Direction** : (Write 200 words).
-    * **Leadership & Org** : (Write 200 words).
-    
-    # 5. INTERNAL CHANGES
-    * **Internal Changes** : (Write 200 words).
-    * **Opportunities** : (Write 200 words).
-    
-    # 6. GROWTH STRATEGY
-    * **Next Beachhead Opportunity** : (Write 200 words).
-    * **Proof Points Needed** : (Write 200 words).
-    
-    # 4. STAKEHOLDER & RELATIONSHIP MAP
-    | Name | Role | Influence | Strategy |
-    
-    # 7. RISKS & CONCERNS
-    * **Relationship Risks** : (Write 200 words).
-    * **Competitive Risks** : {account_data.get('Competitors', 'Extract from transcript')} (Write 200 words).
-    
-    # 8. ACTION PLAN
-    * **Full Year Key Actions** : (Write 200 words).
-    * **Q1 Key Actions** : (Write 200 words).
-    
-    FLOW: Analyze Requirements -> Develop Strategy -> Present Proposal -> Close Deal
+    {plan_layout(account_data, today_str)}
+    """
+
+STATE_KEYS = [
+    "account_data", "chat_stage", "current_section_idx", "plan_generated", "question_queue",
+    "section_summaries", "section_drafts",
+]
+HISTORY_WINDOW = 30
+
+@st.cache_resource
+def get_store():
+    return get_session_store()
+
+store = get_store()
+
+@st.cache_resource
+def warm_up():
+    """Once per process: open the DB pool, prime HTTP connections and preload first-section questions.
+
+    Runs in the background on the pipeline loop; the returned dict doubles as the
+    process-wide cache of extracted section questions.
     """
+    state = {"questions": {}, "timings": {"import": IMPORT_SECONDS}}
+    metrics.observe("startup_seconds", IMPORT_SECONDS, phase="import")
+
+    async def preload_questions(section, level):
+        context = await retrieve_context_async(questions_query(section, level), section=section, help_level=level)
+        response = await llm_chat_async(
+            [{"role": "user", "content": questions_prompt(section, level, context)}], temperature=0.0, json_mode=True,
+            cache_type="questions", cache_template=f"{section}|{level}",
+        )
+        questions = parse_questions(response)
+        if questions: state["questions"].setdefault((section, level), questions)
+
+    async def run():
+        start = time.perf_counter()
+        with metrics.tagged("warmup"):
+            state["timings"].update(await warm_up_async())
+            q_start = time.perf_counter()
+            await asyncio.gather(*(preload_questions(SECTIONS[0], lvl) for lvl in LEVELS))
+        state["timings"]["questions"] = time.perf_counter() - q_start
+        state["timings"]["total"] = time.perf_counter() - start
+        metrics.observe("startup_seconds", state["timings"]["questions"], phase="questions")
+
+    state["future"] = submit(run())
+    return state
+
+warm_up()
+
+def persist_state():
+    store.save_state(st.session_state.session_id, {k: st.session_state[k] for k in STATE_KEYS})
+
+def add_message(role, content):
+    st.session_state.messages.append({"role": role, "content": content})
+    store.append_message(st.session_state.session_id, role, content)
+
+def add_answer(section, answer):
+    st.session_state.section_history[section].append(answer)
+    store.append_answer(st.session_state.session_id, section, answer)
+
+def render_message(msg):
+    with st.chat_message(msg["role"]): st.markdown(msg["content"].replace("$", "\$"))
 
-if "messages" not in st.session_state:
-    st.session_state.messages = [{"role": "assistant", "content": "Let's help you make an Account Plan, please tell the Account name."}]
+if "session_id" not in st.session_state:
+    sid = st.query_params.get("sid")
+    saved = store.load(sid) if sid else None
+    if saved is None:
+        sid = store.create()
+        st.query_params["sid"] = sid
+        saved = {"state": {}, "messages": [], "section_history": {}}
+    st.session_state.session_id = sid
+    for k, v in saved["state"].items(): st.session_state[k] = v
+    st.session_state.messages = saved["messages"]
+    st.session_state.section_history = {s: saved["section_history"].get(s, []) for s in SECTIONS}
+
+if not st.session_state.messages:
+    add_message("assistant", "Let's help you make an Account Plan, please tell the Account name.")
 if "account_data" not in st.session_state:
     st.session_state.account_data = {"Account Name": None, "Tier": None, "Help Level": None}
 if "chat_stage" not in st.session_state: st.session_state.chat_stage = "awaiting_name" 
 if "current_section_idx" not in st.session_state: st.session_state.current_section_idx = 0
 if "plan_generated" not in st.session_state: st.session_state.plan_generated = False
-if "section_history" not in st.session_state: st.session_state.section_history = {s: [] for s in SECTIONS}
 if "question_queue" not in st.session_state: st.session_state.question_queue = []
-
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]): st.markdown(msg["content"].replace("$", "\$"))
+if "section_summaries" not in st.session_state: st.session_state.section_summaries = {}
+if "section_drafts" not in st.session_state: st.session_state.section_drafts = {}
+
+if st.query_params.get("debug") or os.getenv("SHOW_METRICS_PANEL"):
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        summary = metrics.registry.summary()
+        st.dataframe(summary["histograms"], use_container_width=True)
+        st.dataframe(summary["counters"], use_container_width=True)
+        st.json(classifier_hit_rates(), expanded=False)
+        st.json(warm_up()["timings"], expanded=False)
+        st.download_button("Prometheus", metrics.registry.to_prometheus(), "metrics.prom", "text/plain")
+        st.download_button("JSON", metrics.registry.to_json(), "metrics.json", "application/json")
+
+older = len(st.session_state.messages) - HISTORY_WINDOW
+if older > 0 and st.toggle(f"Show {older} earlier messages"):
+    for msg in st.session_state.messages[:older]: render_message(msg)
+for msg in st.session_state.messages[max(older, 0):]: render_message(msg)
 
 if st.session_state.plan_generated:
     st.divider(); st.subheader("📥 Download Report")
@@ -536,8 +627,8 @@ if st.session_state.plan_generated:
     st.divider()
 
 if prompt := st.chat_input("Type your answer here"):
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    with st.chat_message("user"): st.markdown(prompt.replace("$", "\$"))
+    add_message("user", prompt)
+    render_message({"role": "user", "content": prompt})
     
     with st.spinner("Thinking..."):
         ai_response = None
@@ -553,10 +644,16 @@ if prompt := st.chat_input("Type your answer here"):
             
             Output JSON: {{"category": "social_query/simple_greeting/name/gibberish"}}
             """
-            val_res = llm_chat([{"role": "user", "content": val_prompt}], temperature=0.0, json_mode=True)
-            category = "gibberish"
-            try: category = json.loads(re.search(r'\{.*\}', val_res, re.DOTALL).group(0)).get("category", "gibberish")
-            except: pass
+            category = fast_classify("name", prompt)
+            if category is None:
+                with metrics.stage("classify"):
+                    val_res = llm_chat(
+                        [{"role": "user", "content": val_prompt}], temperature=0.0, json_mode=True,
+                        cache_type="classify_name", cache_text=prompt,
+                    )
+                category = "gibberish"
+                try: category = json.loads(re.search(r'\{.*\}', val_res, re.DOTALL).group(0)).get("category", "gibberish")
+                except: pass
             
             if category == "social_query":
                 ai_response = "I am fantastic! Let's help you make an account plan. What is the Account Name?"
@@ -606,10 +703,16 @@ if prompt := st.chat_input("Type your answer here"):
             3. "valid": Anything else.
             Output JSON: {{"status": "..."}}
             """
-            val_res = llm_chat([{"role": "user", "content": val_prompt}], temperature=0.0, json_mode=True)
-            status = "valid"
-            try: status = json.loads(re.search(r'\{.*\}', val_res, re.DOTALL).group(0)).get("status", "valid")
-            except: pass
+            status = fast_classify("interview", prompt)
+            if status is None:
+                with metrics.stage("classify"):
+                    val_res = llm_chat(
+                        [{"role": "user", "content": val_prompt}], temperature=0.0, json_mode=True,
+                        cache_type="classify_interview", cache_text=prompt,
+                    )
+                status = "valid"
+                try: status = json.loads(re.search(r'\{.*\}', val_res, re.DOTALL).group(0)).get("status", "valid")
+                except: pass
             
             if status == "stop":
                 st.session_state.chat_stage = "generating"
@@ -620,20 +723,42 @@ if prompt := st.chat_input("Type your answer here"):
             
             else:
                 extract_smart_data(prompt)
+                invalidate_drafts(
+                    st.session_state.session_id,
+                    st.session_state.section_drafts,
+                    st.session_state.account_data,
+                    st.session_state.section_history,
+                    st.session_state.section_summaries,
+                )
                 
                 curr_sec = SECTIONS[st.session_state.current_section_idx]
-                st.session_state.section_history[curr_sec].append(f"Answer: {prompt}")
+                add_answer(curr_sec, f"Answer: {prompt}")
+                update_section_summary(
+                    st.session_state.session_id,
+                    curr_sec,
+                    st.session_state.section_history[curr_sec],
+                    st.session_state.section_summaries,
+                )
                 
                 if st.session_state.question_queue:
                     st.session_state.question_queue = prune_questions(st.session_state.question_queue, prompt)
                 
                 ack_prompt = f"User Answer: '{prompt}'. Write short 5-word acknowledgement. No 'That makes sense'."
-                ack = llm_chat([{"role": "user", "content": ack_prompt}], temperature=0.7)
+                with metrics.stage("ack"):
+                    ack = llm_chat([{"role": "user", "content": ack_prompt}], temperature=0.7)
                 
                 if st.session_state.question_queue:
                     next_q = st.session_state.question_queue.pop(0)
                     ai_response = f"{ack}\n\n{next_q}"
                 else:
+                    start_section_drafts(
+                        st.session_state.session_id,
+                        curr_sec,
+                        st.session_state.account_data,
+                        st.session_state.section_history,
+                        st.session_state.section_summaries,
+                        st.session_state.section_drafts,
+                    )
                     st.session_state.current_section_idx += 1
                     found_next = False
                     
@@ -660,20 +785,33 @@ if prompt := st.chat_input("Type your answer here"):
                         st.session_state.chat_stage = "generating"
 
         if st.session_state.chat_stage == "generating" and not ai_response:
-            transcript_text = ""
-            for sec, items in st.session_state.section_history.items():
-                transcript_text += f"SECTION: {sec}\n" + "\n".join(items) + "\n\n"
-            
-            final_prompt = get_system_prompt(st.session_state.account_data, transcript_text)
-            
-            with st.status("Generating Report"):
-                ai_response = llm_chat([{"role": "user", "content": final_prompt}], temperature=0.3)
+            with st.status("Generating Report"), metrics.stage("generate"):
+                collect_summaries(st.session_state.session_id, st.session_state.section_summaries, wait=True)
+                ai_response = assemble_plan(
+                    st.session_state.session_id,
+                    st.session_state.section_history,
+                    st.session_state.section_summaries,
+                    st.session_state.account_data,
+                    st.session_state.section_drafts,
+                )
+                if not ai_response:
+                    transcript_text = build_transcript(
+                        SECTIONS,
+                        st.session_state.section_history,
+                        st.session_state.section_summaries,
+                        st.session_state.account_data,
+                    )
+                    final_prompt = get_system_prompt(st.session_state.account_data, transcript_text)
+                    ai_response = llm_chat([{"role": "user", "content": final_prompt}], temperature=0.3)
                 if ai_response: st.session_state.plan_generated = True
                 else: ai_response = "Error: Generation failed."
 
         if ai_response:
-            st.session_state.messages.append({"role": "assistant", "content": ai_response})
-        else:
-            if st.session_state.chat_stage != "generating": st.error("Connection Error.")
-            
-        st.rerun()
\ No newline at end of file
+            add_message("assistant", ai_response)
+        persist_state()
+
+    if ai_response:
+        if st.session_state.plan_generated: st.rerun()
+        render_message({"role": "assistant", "content": ai_response})
+    elif st.session_state.chat_stage != "generating":
+        st.error("Connection Error.")
\ No newline at end of file